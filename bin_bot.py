@@ -1,16 +1,32 @@
-import json
 import asyncio
-import aiohttp
 import logging
 import os
+import re
+import time
+import orjson
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
+from lxml import etree, html as lhtml
+from utils.tools import atomic_write
 
-load_dotenv()
+# Ordinal suffixes ('3rd' -> '3') and the cleaned Kingston date format
+_ORDINAL_RE = re.compile(r'(\d+)(?:st|nd|rd|th)')
+_FMT = "%A %d %B %Y"
+
+# Waits between polls for the loading fragment: probe early, then settle at 3s
+_RETRY_DELAYS = (0.5, 0.75, 1, 1.5, 2)
 
 class BinBot:
-    def __init__(self):
+    # Compiled once per process: service headings (minus Bulky) and the 'Next collection' date after each
+    _xp_service = etree.XPath(
+        "//h3[contains(@class,'waste-service-name')][not(contains(.,'Bulky'))]"
+    )
+    _xp_next_date = etree.XPath(
+        "./following::div[contains(@class,'govuk-grid-row')][1]"
+        "//dt[contains(.,'Next collection')]/following-sibling::dd[1]"
+    )
+
+    def __init__(self, session):
+        self.session = session
         self.base_url = os.getenv("WASTE_URL")
         self.data_url = f"{self.base_url}?page_loading=1"
         self.cache_file = "bins.json"
@@ -23,58 +39,76 @@ class BinBot:
 
     def load_cache(self):
         try:
-            with open(self.cache_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            with open(self.cache_file, 'rb') as f:
+                return orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
             return None
 
     def save_cache(self, data):
-        with open(self.cache_file, 'w') as f:
-            json.dump(data, f)
+        # Unchanged schedule (the usual case on refresh): leave the file alone
+        if data == self.load_cache():
+            return
+        atomic_write(self.cache_file, orjson.dumps(data))
 
     async def fetch_bin_data(self):
         """Scrapes the council site with retries for the loading fragment."""
-        async with aiohttp.ClientSession(headers=self.headers) as session:
-            try:
-                # Step 1: Establish Session (Crucial for cookies)
-                await session.get(self.base_url)
+        try:
+            # Step 1: Establish Session (Crucial for cookies)
+            async with self.session.get(self.base_url, headers=self.headers) as resp:
+                await resp.read()
+            
+            for attempt in range(15): # Increased to match your 3rd-attempt success
+                logging.info(f'BinBot Fetch attempt: {attempt + 1}')
+                delay = _RETRY_DELAYS[attempt] if attempt < len(_RETRY_DELAYS) else 3
+                async with self.session.get(self.data_url, headers=self.headers) as resp:
+                    status = resp.status
+                    body = await resp.read()
+
+                # Client errors won't fix themselves; server errors get an exponential backoff
+                if 400 <= status < 500:
+                    logging.error(f"BinBot Fetch: HTTP {status}, giving up")
+                    return None
+                if status >= 500:
+                    await asyncio.sleep(min(2 ** attempt * 0.25, 5))
+                    continue
+
+                # Cheap byte scan first: skip the parse until the loading fragment has rendered
+                if b'waste-service-name' not in body:
+                    await asyncio.sleep(delay)
+                    continue
+                doc = lhtml.fromstring(body.decode('utf-8', errors='replace'))
                 
-                for attempt in range(15): # Increased to match your 3rd-attempt success
-                    logging.info(f'BinBot Fetch attempt: {attempt + 1}')
-                    async with session.get(self.data_url) as resp:
-                        html = await resp.text()
-                        soup = BeautifulSoup(html, 'html.parser')
-                        
-                        # Look for the headers that indicate data has loaded
-                        services = soup.find_all('h3', class_='waste-service-name')
+                # Look for the headers that indicate data has loaded
+                services = self._xp_service(doc)
+                
+                if services:
+                    collections = []
+                    print(f"✅ Data received on attempt {attempt + 1}!")
+                    for service in services:
+                        bin_name = service.text_content().strip()
+
+                        # Next GDS Summary List row -> 'Next collection' <dd>
+                        date_dd = self._xp_next_date(service)
+                        if date_dd:
+                            date_text = " ".join(t.strip() for t in date_dd[0].itertext() if t.strip())
+                            clean_date = date_text.split('(')[0].strip()
+                            print(f"• {bin_name.ljust(22)} : {clean_date}")
+                            entry = {"type": bin_name, "date": clean_date}
+                            # Cache the parsed date so the scheduler can skip the ordinal cleaner
+                            try:
+                                entry["iso"] = self.parse_kingston_date(clean_date, datetime.now()).isoformat()
+                            except ValueError:
+                                pass
+                            collections.append(entry)
+                    if collections:
+                        logging.info(f"✅ BinBot data retrieved successfully on attempt {attempt + 1}")
+                        return collections
                         
-                        if services:
-                            collections = []
-                            print(f"✅ Data received on attempt {attempt + 1}!")
-                            for service in services:
-                                bin_name = service.get_text(strip=True)
-                                if "Bulky" in bin_name: continue
-
-                                # Navigate GDS Summary List structure
-                                parent_row = service.find_next('div', class_='govuk-grid-row')
-                                if parent_row:
-                                    next_col_dt = parent_row.find('dt', string=lambda t: t and "Next collection" in t)
-                                    if next_col_dt:
-                                        date_dd = next_col_dt.find_next_sibling('dd')
-                                        if date_dd:
-                                            clean_date = date_dd.get_text(" ", strip=True).split('(')[0].strip()
-                                            print(f"• {bin_name.ljust(22)} : {clean_date}")
-                                            clean_date = date_dd.get_text(" ", strip=True).split('(')[0].strip()
-                                            collections.append({"type": bin_name, "date": clean_date})
-                            if collections:
-                                logging.info(f"✅ BinBot data retrieved successfully on attempt {attempt + 1}")
-                                return collections
-                                
-                    await asyncio.sleep(2)
-                return None
-            except Exception as e:
-                logging.error(f"BinBot Fetch Error: {e}")
-                return None
+                await asyncio.sleep(delay)
+            return None
+        except Exception as e:
+            logging.error(f"BinBot Fetch Error: {e}")
+            return None
 
     async def get_next_run_delay(self, collections):
         """Calculates delay until 9am the day after the closest collection."""
@@ -96,12 +130,32 @@ class BinBot:
 
     def clean_kingston_date(self, date_str):
         """Removes ordinal suffixes (st, nd, rd, th) and commas for parsing."""
-        # Remove commas
-        date_str = date_str.replace(",", "")
-        # Remove suffixes: find 'st', 'nd', 'rd', 'th' preceded by a digit and remove them
-        import re
-        date_str = re.sub(r'(\d+)(st|nd|rd|th)', r'\1', date_str)
-        return date_str
+        return _ORDINAL_RE.sub(r'\1', date_str.replace(",", ""))
+
+    def parse_kingston_date(self, date_str, now):
+        """Parses a council date string, assuming the current year unless it has wrapped."""
+        clean_date = self.clean_kingston_date(date_str)
+        # Format is now: 'Saturday 3 January 2026'
+        dt = datetime.strptime(f"{clean_date} {now.year}", _FMT)
+        
+        # Handle year wrap-around
+        if dt < now - timedelta(days=2): 
+            dt = dt.replace(year=now.year + 1)
+        return dt
+
+    def upcoming_dates(self, data, now):
+        """Sorted (date, type) pairs whose refresh time (09:00 the day after) is still ahead."""
+        parsed_dates = []
+        for c in data:
+            # Cached ISO when available; older caches go through the cleaner
+            if c.get('iso'):
+                dt = datetime.fromisoformat(c['iso'])
+            else:
+                dt = self.parse_kingston_date(c['date'], now)
+            if (dt + timedelta(days=1)).replace(hour=9, minute=0, second=0) > now:
+                parsed_dates.append((dt, c['type']))
+        parsed_dates.sort(key=lambda x: x[0])
+        return parsed_dates
     
     async def bin_scheduler(self, alert_callback):
         """Sequential scheduler: Sleeps until Night Before, Morning Of, then Refreshes."""
@@ -118,21 +172,18 @@ class BinBot:
                     await asyncio.sleep(3600) # Retry in 1 hour if fetch failed
                     continue
 
-                # 2. Parse dates using the cleaner
-                now = datetime.now()
-                parsed_dates = []
-                for c in data:
-                    clean_date = self.clean_kingston_date(c['date'])
-                    # Format is now: 'Saturday 3 January 2026'
-                    dt = datetime.strptime(f"{clean_date} {now.year}", "%A %d %B %Y")
-                    
-                    # Handle year wrap-around
-                    if dt < now - timedelta(days=2): 
-                        dt = dt.replace(year=now.year + 1)
-                    parsed_dates.append((dt, c['type']))
-                
-                # Sort to find the nearest collection day
-                parsed_dates.sort(key=lambda x: x[0])
+                # 2. Parse dates, skipping collections that are already done with
+                parsed_dates = self.upcoming_dates(data, datetime.now())
+                if not parsed_dates:
+                    logging.info("BinBot: Cached collections have all passed, refreshing...")
+                    data = await self.fetch_bin_data()
+                    if data: self.save_cache(data)
+                    # Fetch failed or the council still lists nothing ahead: don't spin
+                    if not data or not self.upcoming_dates(data, datetime.now()):
+                        await asyncio.sleep(3600)
+                    continue
+
+                # Nearest collection day first
                 next_date, _ = parsed_dates[0]
                 
                 # Identify all bins due on that same day
@@ -140,37 +191,43 @@ class BinBot:
                 items_str = ", ".join(due_types)
 
                 # 3. MILESTONE SEQUENCE
+                # Wall-clock anchors are converted to epoch seconds once; delays are plain float diffs
+                now_ts = time.time()
+
                 # Milestone 1: Night Before (18:00)
                 night_before = next_date - timedelta(days=1)
-                night_before = night_before.replace(hour=18, minute=0, second=0)
+                night_before_ts = night_before.replace(hour=18, minute=0, second=0).timestamp()
                 
-                if now < night_before:
-                    delay = (night_before - now).total_seconds()
+                if now_ts < night_before_ts:
+                    delay = night_before_ts - now_ts
                     logging.info(f"BinBot: Sleeping {delay/3600:.1f}h until Night Before reminder.")
                     await asyncio.sleep(delay)
                     await alert_callback(f"🌙 *Night Before* Bin Reminder:\nItems: **{items_str}**")
-                    now = datetime.now()
+                    now_ts = time.time()
 
                 # Milestone 2: Morning Of (07:00)
-                morning_of = next_date.replace(hour=7, minute=0, second=0)
-                if now < morning_of:
-                    delay = (morning_of - now).total_seconds()
+                morning_of_ts = next_date.replace(hour=7, minute=0, second=0).timestamp()
+                if now_ts < morning_of_ts:
+                    delay = morning_of_ts - now_ts
                     logging.info(f"BinBot: Sleeping {delay/3600:.1f}h until Morning Of reminder.")
                     await asyncio.sleep(delay)
                     await alert_callback(f"☀️ *Morning Of* Bin Reminder:\nItems: **{items_str}**")
-                    now = datetime.now()
+                    now_ts = time.time()
 
                 # Milestone 3: Refresh Data (09:00 the day AFTER collection)
-                refresh_time = (next_date + timedelta(days=1)).replace(hour=9, minute=0, second=0)
-                if now < refresh_time:
-                    delay = (refresh_time - now).total_seconds()
+                refresh_ts = (next_date + timedelta(days=1)).replace(hour=9, minute=0, second=0).timestamp()
+                if now_ts < refresh_ts:
+                    delay = refresh_ts - now_ts
                     logging.info(f"BinBot: Collection passed. Sleeping {delay/3600:.1f}h until refresh.")
                     await asyncio.sleep(delay)
                 
                 # Perform the refresh to get next week's dates
                 logging.info("BinBot: Refreshing collection schedule...")
                 data = await self.fetch_bin_data()
-                if data: self.save_cache(data)
+                if data:
+                    self.save_cache(data)
+                else:
+                    await asyncio.sleep(3600) # Retry in 1 hour if fetch failed
 
             except Exception as e:
                 logging.error(f"BinBot Scheduler Error: {e}")
@@ -1,26 +1,89 @@
 import os
 import asyncio
+import bisect
 import datetime as dt
-import json
+import time
 import dateparser
-from utils.tools import logger
+import orjson
+from utils.tools import atomic_write, logger
+
+MAX_SLEEP = 3600 # Re-check the wall clock at least hourly so clock corrections (NTP, suspend) don't skew timers
 
 class ReminderBot:
     def __init__(self):
-        self.reminders_file = os.path.join("data", "reminders.json")
+        # Append-only log: one line per added reminder, plus {"del": id} lines for deletions
+        self.reminders_file = os.path.join("data", "reminders.jsonl")
+        self.legacy_file = os.path.join("data", "reminders.json")
+        # data/ isn't in the repo; the startup compaction below writes into it
+        os.makedirs(os.path.dirname(self.reminders_file), exist_ok=True)
         self.reminders = self.load_reminders()
+        self._next_id = max((r["id"] for r in self.reminders), default=-1) + 1
+        self._compact()
+        # Set by check_reminders; until then reminders are only queued in self.reminders
+        self._alert_callback = None
 
     def load_reminders(self):
+        """Replays the log into the live list (falls back to the old reminders.json)."""
+        live = {}
         if os.path.exists(self.reminders_file):
+            with open(self.reminders_file, "rb") as f:
+                for line in f:
+                    try:
+                        rec = orjson.loads(line)
+                    except ValueError:
+                        continue # Torn last line from a crash mid-append
+                    if "del" in rec:
+                        live.pop(rec["del"], None)
+                    else:
+                        live[rec["id"]] = rec
+        elif os.path.exists(self.legacy_file):
             try:
-                with open(self.reminders_file, "r") as f:
-                    return json.load(f)
-            except: return []
-        return []
+                with open(self.legacy_file, "rb") as f:
+                    for i, r in enumerate(orjson.loads(f.read())):
+                        live[i] = {"id": i, **r}
+            except (OSError, ValueError): pass
+        # Parse each due time once; '_'-prefixed keys are in-memory only
+        for r in live.values():
+            r["_t"] = dt.datetime.fromisoformat(r["time"]).timestamp()
+        # Kept sorted soonest-first from here on, so /list and /del can index directly
+        return sorted(live.values(), key=lambda r: r["_t"])
+
+    @staticmethod
+    def _persisted(reminder):
+        return {k: v for k, v in reminder.items() if not k.startswith("_")}
+
+    def _append(self, records):
+        with open(self.reminders_file, "ab") as f:
+            f.write(b"".join(orjson.dumps(self._persisted(r)) + b"\n" for r in records))
+        self._log_lines += len(records)
+
+    def _compact(self):
+        """Rewrites the log with only the live reminders."""
+        atomic_write(self.reminders_file, b"".join(orjson.dumps(self._persisted(r)) + b"\n" for r in self.reminders))
+        self._log_lines = len(self.reminders)
+        self._dead_lines = 0
+
+    def _log_removed(self, removed):
+        self._append([{"del": r["id"]} for r in removed])
+        # Both the original add line and its tombstone are now dead weight
+        self._dead_lines += 2 * len(removed)
+        if self._dead_lines > 0.2 * self._log_lines:
+            self._compact()
+
+    def _schedule(self, reminder):
+        if self._alert_callback:
+            reminder["_task"] = asyncio.create_task(self._fire_at(reminder))
 
-    def save_reminders(self):
-        with open(self.reminders_file, "w") as f:
-            json.dump(self.reminders, f, indent=4)
+    async def _fire_at(self, reminder):
+        """Sleeps until the reminder is due, sends it, then drops it from the log."""
+        while (wait := reminder["_t"] - time.time()) > 0:
+            await asyncio.sleep(min(wait, MAX_SLEEP))
+        try:
+            await self._alert_callback(f"🔔 **REMINDER**: {reminder['task']}")
+        except Exception as e:
+            logger.error(f"Reminder Alert Error: {e}")
+        self.reminders = [r for r in self.reminders if r["id"] != reminder["id"]]
+        self._log_removed([reminder])
 
     async def handle_command(self, text):
         parts = text.split()
@@ -32,11 +95,9 @@ class ReminderBot:
             if not self.reminders:
                 return "📭 No pending reminders."
             
-            # Sort by time so the soonest is at the top
-            sorted_r = sorted(self.reminders, key=lambda x: x['time'])
             msg = "🗓 **Pending Reminders:**\n"
-            for i, r in enumerate(sorted_r):
-                t = dt.datetime.fromisoformat(r['time']).strftime('%d %b, %H:%M')
+            for i, r in enumerate(self.reminders):
+                t = dt.datetime.fromtimestamp(r['_t']).strftime('%d %b, %H:%M')
                 msg += f"{i+1}. **{t}**: {r['task']}\n"
             return msg
 
@@ -44,11 +105,10 @@ class ReminderBot:
         if cmd == "/del" and len(parts) > 1:
             try:
                 idx = int(parts[1]) - 1
-                sorted_r = sorted(self.reminders, key=lambda x: x['time'])
-                removed = sorted_r.pop(idx)
-                # Sync back to main list
-                self.reminders = sorted_r
-                self.save_reminders()
+                removed = self.reminders.pop(idx)
+                if removed.get("_task"):
+                    removed["_task"].cancel()
+                self._log_removed([removed])
                 return f"✅ Deleted: {removed['task']}"
             except:
                 return "❌ Use `/del [number]` from the `/list`."
@@ -68,11 +128,16 @@ class ReminderBot:
             if not target_time:
                 return f"❓ Unsure when '{time_phrase.strip()}' is."
 
-            self.reminders.append({
+            new = {
+                "id": self._next_id,
                 "time": target_time.isoformat(),
-                "task": task.strip()
-            })
-            self.save_reminders()
+                "task": task.strip(),
+                "_t": target_time.timestamp()
+            }
+            self._next_id += 1
+            bisect.insort(self.reminders, new, key=lambda r: r["_t"])
+            self._schedule(new)
+            self._append([new])
             return f"✅ Set for {target_time.strftime('%H:%M (%a)')}: {task.strip()}"
 
         if cmd == '/usage' or cmd == '/help':
@@ -83,28 +148,7 @@ class ReminderBot:
             "• `/usage`: Shows this quick-start guide.")
 
     async def check_reminders(self, alert_callback):
-        """The Polling Loop: Computatially cheap and survives restarts."""
-        while True:
-            try:
-                now = dt.datetime.now()
-                due = []
-                remaining = []
-
-                for r in self.reminders:
-                    if dt.datetime.fromisoformat(r["time"]) <= now:
-                        due.append(r)
-                    else:
-                        remaining.append(r)
-
-                for r in due:
-                    await alert_callback(f"🔔 **REMINDER**: {r['task']}")
-                
-                if due:
-                    self.reminders = remaining
-                    self.save_reminders()
-
-            except Exception as e:
-                logger.error(f"Reminder Loop Error: {e}")
-            
-            # Sleeping for 60 seconds uses near-zero CPU
-            await asyncio.sleep(60)
\ No newline at end of file
+        """Arms one timer task per pending reminder; /remind arms new ones as they arrive."""
+        self._alert_callback = alert_callback
+        for r in self.reminders:
+            self._schedule(r)
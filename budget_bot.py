@@ -1,20 +1,24 @@
 import asyncio
-import json
 import logging
 import os
+import time
+import orjson
 from datetime import datetime, timedelta
+from utils.tools import atomic_write
 
 # --- Configuration ---
 STATE_FILE = "budget_state.json"
+SAVE_DELAY = 5 # Seconds to coalesce bursts of transactions into one write
 
 class BudgetBot:
     def __init__(self):
         self.state = self.load_state()
+        self._save_handle = None
 
     def load_state(self):
         try:
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
+            with open(STATE_FILE, "rb") as f:
+                return orjson.loads(f.read())
         except (OSError, ValueError):
             return {
                 "balance": 0.0,
@@ -24,8 +28,20 @@ class BudgetBot:
             }
 
     def save_state(self):
-        with open(STATE_FILE, "w") as f:
-            json.dump(self.state, f, indent=4)
+        # A direct save supersedes any pending debounced one
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        atomic_write(STATE_FILE, orjson.dumps(self.state, option=orjson.OPT_INDENT_2))
+
+    def schedule_save(self):
+        """Debounced save: the first change arms a timer, later changes ride along with it."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.save_state()
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(SAVE_DELAY, self.save_state)
 
     async def weekly_task(self, alert_callback):
         while True:
@@ -59,7 +75,7 @@ class BudgetBot:
                         next_update = new_last_update + timedelta(days=7)
 
                 # 3. Sleep until the next scheduled update
-                wait_seconds = (next_update - datetime.now()).total_seconds()
+                wait_seconds = next_update.timestamp() - time.time()
                 
                 if wait_seconds > 0:
                     logging.info(f"BudgetBot: Sleeping for {wait_seconds/3600:.1f} hours until next allowance.")
@@ -80,7 +96,7 @@ class BudgetBot:
             "comment": comment if comment else "Manual Entry"
         })
         self.state["history"] = self.state["history"][-10:]
-        self.save_state()
+        self.schedule_save()
         return self.state["balance"]
 
     async def handle_command(self, text):
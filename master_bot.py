@@ -2,7 +2,7 @@ import asyncio
 import aiohttp
 import logging
 import os
-import json
+import orjson
 from dotenv import load_dotenv
 import httpx
 import base64
@@ -14,12 +14,15 @@ from bin_bot import BinBot
 from nest_bot import NestBot
 from bots.reminder_bot import ReminderBot
 
-load_dotenv()
+load_dotenv() # The one .env load; the bots read os.environ in __init__
 
 # --- Global Configuration ---
 SIGNAL_API_BASE = "http://localhost:8080"
 SIGNAL_NUMBER = os.getenv("SIGNAL_NUMBER")
 POLL_INTERVAL = 2
+JSON_HEADERS = {"Content-Type": "application/json"}
+MAX_POLL_INTERVAL = 30 # Idle polling backs off 2s -> 4s -> ... -> 30s
+SENDER_WORKERS = 4 # Concurrent /v2/send requests draining the outbound queue
 
 # Mapping Internal IDs (what we see) to External IDs (where we send)
 # This handles both Group IDs and direct phone numbers
@@ -34,6 +37,12 @@ BOT_ROUTING = {
 
 logging.basicConfig(level=logging.INFO)
 
+def encode_attachment(filepath):
+    """Blocking read + base64 of a clip; run in a worker thread, not on the event loop."""
+    with open(filepath, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode('utf-8')
+    return f"data:video/mp4;filename={os.path.basename(filepath)};base64,{b64}"
+
 async def send_signal(session, message, external_id, filepath=None):
     """Centralized sending function."""
     payload = {
@@ -43,86 +52,93 @@ async def send_signal(session, message, external_id, filepath=None):
         "text_mode": "styled",
         "base64_attachments": []
     }
-    if filepath:
-        with open(filepath, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode('utf-8')
-            payload["base64_attachments"].append(
-                f"data:video/mp4;filename={os.path.basename(filepath)};base64,{b64}"
-            )
     try:
-        async with session.post(f"{SIGNAL_API_BASE}/v2/send", json=payload) as resp:
+        if filepath:
+            payload["base64_attachments"].append(await asyncio.to_thread(encode_attachment, filepath))
+        async with session.post(f"{SIGNAL_API_BASE}/v2/send", data=orjson.dumps(payload), headers=JSON_HEADERS) as resp:
             if resp.status not in [200, 201]:
                 logging.error(f"Send failed: {await resp.text()}")
     except Exception as e:
         logging.error(f"Send error: {e}")
 
-async def master_listener(budget_bot, train_bot, bin_bot, nest_bot, reminder_bot):
+async def sender_worker(session, out_q):
+    """Pulls (message, external_id, filepath) items off the outbound queue and sends them."""
+    while True:
+        message, external_id, filepath = await out_q.get()
+        try:
+            await send_signal(session, message, external_id, filepath)
+        except Exception as e:
+            # A bad item must not take the worker (and main's gather) down with it
+            logging.error(f"Send error: {e}")
+        finally:
+            out_q.task_done()
+
+async def master_listener(session, out_q, budget_bot, train_bot, bin_bot, nest_bot, reminder_bot):
     """The single loop that polls for all messages."""
-    async with aiohttp.ClientSession() as session:
-        logging.info("Master Listener online. Routing messages...")
+    logging.info("Master Listener online. Routing messages...")
+    # Internal ID -> command handler, resolved once rather than re-reading the env per message
+    handlers = {
+        os.getenv("BUDGET_INTERNAL_ID"): budget_bot.handle_command,
+        os.getenv("TRAIN_INTERNAL_ID"): train_bot.handle_command,
+        # os.getenv("TESTING_INTERNAL_ID"): train_bot.handle_command,
+        os.getenv("BIN_INTERNAL_ID"): bin_bot.handle_command,
+        os.getenv("NEST_INTERNAL_ID"): nest_bot.handle_command,
+        os.getenv("REMINDER_INTERNAL_ID"): reminder_bot.handle_command,
+    }
+    handlers.pop(None, None) # Unconfigured bots
+    idle_delay = POLL_INTERVAL
+    
+    while True:
+        got_messages = False
+        try:
+            receive_url = f"{SIGNAL_API_BASE}/v1/receive/{SIGNAL_NUMBER}"
+            async with session.get(receive_url) as resp:
+                if resp.status == 200:
+                    body = await resp.read()
+                    got_messages = b'"envelope"' in body
+                    # Only '/'-commands are routed, so batches of plain chatter are never decoded
+                    data = orjson.loads(body) if b'"message":"/' in body else None
+                    if data and data != "null":
+                        for msg in data:
+                            envelope = msg.get("envelope", {})
+                            
+                            # Extract content from normal or sync messages
+                            data_msg = envelope.get("dataMessage")
+                            sync_msg = envelope.get("syncMessage", {}).get("sentMessage")
+                            target_msg = data_msg or sync_msg
+
+                            if not target_msg:
+                                continue
+
+                            # Identify the sender/group (Internal ID)
+                            # For private chats, groupInfo is missing; we use 'source'
+                            internal_id = target_msg.get("groupInfo", {}).get("groupId") or envelope.get("source")
+                            incoming_text = target_msg.get("message")
+
+                            if not incoming_text or not incoming_text.startswith("/"):
+                                continue
+                            print(f"incoming message received from {internal_id}")
+                            # --- ROUTING LOGIC ---
+                            handler = handlers.get(internal_id)
+                            if not handler:
+                                logging.info(f"Ignored command from unknown source: {internal_id}")
+                                continue
+
+                            reply = await handler(incoming_text)
+                            if not reply:
+                                continue
+                            if isinstance(reply, tuple) and reply[0] == "FILE":
+                                # reply = ("FILE", "Message text", "filepath")
+                                out_q.put_nowait((reply[1], BOT_ROUTING[internal_id], reply[2]))
+                            else:
+                                out_q.put_nowait((reply, BOT_ROUTING[internal_id], None))
+
+        except Exception as e:
+            logging.error(f"Polling error: {e}")
         
-        while True:
-            try:
-                receive_url = f"{SIGNAL_API_BASE}/v1/receive/{SIGNAL_NUMBER}"
-                async with session.get(receive_url) as resp:
-                    if resp.status == 200:
-                        data = await resp.json(content_type=None)
-                        if data and data != "null":
-                            for msg in data:
-                                envelope = msg.get("envelope", {})
-                                
-                                # Extract content from normal or sync messages
-                                data_msg = envelope.get("dataMessage")
-                                sync_msg = envelope.get("syncMessage", {}).get("sentMessage")
-                                target_msg = data_msg or sync_msg
-
-                                if not target_msg:
-                                    continue
-
-                                # Identify the sender/group (Internal ID)
-                                # For private chats, groupInfo is missing; we use 'source'
-                                internal_id = target_msg.get("groupInfo", {}).get("groupId") or envelope.get("source")
-                                incoming_text = target_msg.get("message")
-
-                                if not incoming_text or not incoming_text.startswith("/"):
-                                    continue
-                                print(f"incoming message received from {internal_id}")
-                                # --- ROUTING LOGIC ---
-                                if internal_id == os.getenv("BUDGET_INTERNAL_ID"):
-                                    reply = await budget_bot.handle_command(incoming_text)
-                                    if reply:
-                                        await send_signal(session, reply, BOT_ROUTING[internal_id])
-
-                                elif internal_id == os.getenv("TRAIN_INTERNAL_ID"):
-                                # elif internal_id == os.getenv("TESTING_INTERNAL_ID"):
-                                    reply = await train_bot.handle_command(incoming_text)
-                                    if reply:
-                                        await send_signal(session, reply, BOT_ROUTING[internal_id])
-
-                                elif internal_id == os.getenv("BIN_INTERNAL_ID"):
-                                    reply = await bin_bot.handle_command(incoming_text)
-                                    if reply:
-                                        await send_signal(session, reply, BOT_ROUTING[internal_id])
-                                elif internal_id == os.getenv("NEST_INTERNAL_ID"):
-                                    reply = await nest_bot.handle_command(incoming_text)
-                                    if reply:
-                                        if isinstance(reply, tuple) and reply[0] == "FILE":
-                                            # reply = ("FILE", "Message text", "filepath")
-                                            await send_signal(session, reply[1], BOT_ROUTING[internal_id], reply[2])
-                                        else:
-                                            await send_signal(session, reply, BOT_ROUTING[internal_id])
-                                elif internal_id == os.getenv("REMINDER_INTERNAL_ID"):
-                                    reply = await reminder_bot.handle_command(incoming_text)
-                                    if reply:
-                                        await send_signal(session, reply, BOT_ROUTING[internal_id])
-                                
-                                else:
-                                    logging.info(f"Ignored command from unknown source: {internal_id}")
-
-            except Exception as e:
-                logging.error(f"Polling error: {e}")
-            
-            await asyncio.sleep(POLL_INTERVAL)
+        # Snap back to fast polling on activity, otherwise back off while the channel is idle
+        idle_delay = POLL_INTERVAL if got_messages else min(idle_delay * 2, MAX_POLL_INTERVAL)
+        await asyncio.sleep(idle_delay)
 
 async def train_alert_monitor(train_bot, session):
     """Specific wrapper to handle train alerts while they are yielded."""
@@ -131,38 +147,53 @@ async def train_alert_monitor(train_bot, session):
         # await send_signal(session, alert_msg, os.getenv("TESTING_RECIPIENT"))
 
 async def main():
-    budget_bot = BudgetBot()
-    train_bot = TrainBot()
-    bin_bot = BinBot()
-    nest_bot = NestBot()
-    reminder_bot = ReminderBot()
+    # One pooled session for every outbound request so keep-alive connections are reused
+    # DNS answers are cached for 5 minutes so repeat council/rail fetches skip resolution
+    connector = aiohttp.TCPConnector(
+        limit=100, limit_per_host=10, keepalive_timeout=75, enable_cleanup_closed=True,
+        use_dns_cache=True, ttl_dns_cache=300
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        budget_bot = BudgetBot()
+        train_bot = TrainBot(session)
+        bin_bot = BinBot(session)
+        nest_bot = NestBot()
+        reminder_bot = ReminderBot()
+
+        # Outbound messages are queued and sent by a small pool of workers
+        out_q = asyncio.Queue()
 
-    async with aiohttp.ClientSession() as session:
         # Define a small helper to bridge the TrainBot alert to the MasterBot sender
         async def train_alert_handler(message):
-            await send_signal(session, message, os.getenv("TRAIN_RECIPIENT"))
-            # await send_signal(session, message, os.getenv("TESTING_RECIPIENT"))
+            out_q.put_nowait((message, os.getenv("TRAIN_RECIPIENT"), None))
+            # out_q.put_nowait((message, os.getenv("TESTING_RECIPIENT"), None))
 
         async def bin_alert_handler(message):
-            await send_signal(session, message, os.getenv("BIN_RECIPIENT"))
+            out_q.put_nowait((message, os.getenv("BIN_RECIPIENT"), None))
 
         async def budget_alert_handler(message):
-            await send_signal(session, message, os.getenv("BUDGET_RECIPIENT"))
+            out_q.put_nowait((message, os.getenv("BUDGET_RECIPIENT"), None))
 
         async def nest_alert_handler(message, filepath=None):
-            await send_signal(session, message, os.getenv("NEST_RECIPIENT"), filepath)
+            out_q.put_nowait((message, os.getenv("NEST_RECIPIENT"), filepath))
 
         async def remind_alert_handler(message):
-            await send_signal(session, message, os.getenv("REMINDER_RECIPIENT"))
-
-        await asyncio.gather(
-            master_listener(budget_bot, train_bot, bin_bot, nest_bot, reminder_bot),
-            nest_bot.sync_task(nest_alert_handler),
-            budget_bot.weekly_task(budget_alert_handler),
-            train_bot.monitor_subscriptions(train_alert_handler),
-            bin_bot.bin_scheduler(bin_alert_handler),
-            reminder_bot.check_reminders(remind_alert_handler)
-        )
+            out_q.put_nowait((message, os.getenv("REMINDER_RECIPIENT"), None))
+
+        try:
+            await asyncio.gather(
+                *(sender_worker(session, out_q) for _ in range(SENDER_WORKERS)),
+                master_listener(session, out_q, budget_bot, train_bot, bin_bot, nest_bot, reminder_bot),
+                nest_bot.sync_task(nest_alert_handler),
+                budget_bot.weekly_task(budget_alert_handler),
+                train_bot.monitor_subscriptions(train_alert_handler),
+                bin_bot.bin_scheduler(bin_alert_handler),
+                reminder_bot.check_reminders(remind_alert_handler)
+            )
+        finally:
+            # Flush any debounced writes before exiting
+            budget_bot.save_state()
+            train_bot.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,13 +1,24 @@
 import os
 import datetime as dt
 import asyncio
-from utils.tools import logger
+from utils.tools import atomic_write, logger
 from utils.google_auth_wrapper import GoogleConnection
-from dotenv import load_dotenv
-import json 
+import orjson
 import time
 
-load_dotenv()
+def _download_if_missing(device, event, filepath):
+    """Blocking: streams the clip to filepath unless it is already on disk. Returns bytes written."""
+    if os.path.exists(filepath):
+        return 0
+    return device.download_camera_event_to_file(event, filepath)
+
+def _compact_stamp(ts):
+    """'20240131_174502' for clip filenames; same as strftime('%Y%m%d_%H%M%S') without the locale dispatch."""
+    return f"{ts.year:04d}{ts.month:02d}{ts.day:02d}_{ts.hour:02d}{ts.minute:02d}{ts.second:02d}"
+
+def _alert_stamp(ts):
+    """'31-01-2024_17:45:02' for alert messages; same as strftime('%d-%m-%Y_%H:%M:%S')."""
+    return f"{ts.day:02d}-{ts.month:02d}-{ts.year:04d}_{ts.hour:02d}:{ts.minute:02d}:{ts.second:02d}"
 
 class NestBot:
     def __init__(self):
@@ -23,45 +34,53 @@ class NestBot:
         self.conn = GoogleConnection(self.token, self.username)
         self.devices = self.conn.get_nest_camera_devices()
         self.state = self.load_state()
+        self._state_dirty = False
         self.download_path = os.getenv("DOWNLOAD_PATH", "./downloads")
         self.max_folder_gb = 10  # Max storage limit
         self.max_age_days = 30   # Delete older than a mont
         self.recent_events = [] # Store as (timestamp, camera, filepath)
+        self._sync_limit = asyncio.Semaphore(3) # Concurrent camera syncs (Google rate limits)
 
     def load_state(self):
+        """Device ID -> last synced event time, held as datetimes in memory."""
         if os.path.exists(self.state_file):
             try:
-                with open(self.state_file, "r") as f:
-                    content = f.read().strip()
-                    if not content:  # Handle empty file
-                        return {}
-                    return json.loads(content)
-            except (json.JSONDecodeError, IOError) as e:
+                with open(self.state_file, "rb") as f:
+                    content = f.read()
+                loaded = orjson.loads(content) if content.strip() else {} # Handle empty file
+                return {k: dt.datetime.fromisoformat(v) if isinstance(v, str) else v for k, v in loaded.items()}
+            except (orjson.JSONDecodeError, OSError, ValueError) as e:
                 logger.error(f"Error loading state file: {e}. Resetting state.")
                 return {}
         return {}
 
     def save_state(self):
-        with open(self.state_file, "w") as f:
-            json.dump(self.state, f)
+        # orjson writes the datetimes as ISO 8601, which load_state parses back
+        atomic_write(self.state_file, orjson.dumps(self.state))
+        self._state_dirty = False
 
     def cleanup_storage(self):
         """Deletes files older than N days or if folder exceeds GB limit"""
-        files = [os.path.join(self.download_path, f) for f in os.listdir(self.download_path)]
-        files.sort(key=os.path.getmtime) # Oldest first
-
-        # Delete by age
-        now = time.time()
-        for f in files[:]:
-            if os.path.getmtime(f) < now - (self.max_age_days * 86400):
-                os.remove(f)
-                files.remove(f)
+        # One readdir + one stat per file; everything below reuses the cached stat
+        with os.scandir(self.download_path) as it:
+            files = [(e.path, e.stat()) for e in it if e.is_file()]
+        files.sort(key=lambda f: f[1].st_mtime) # Oldest first
+
+        # Delete by age (single pass; survivors stay oldest-first)
+        cutoff = time.time() - self.max_age_days * 86400
+        kept = []
+        for path, st in files:
+            if st.st_mtime < cutoff:
+                os.remove(path)
+            else:
+                kept.append((path, st))
+        files = kept
 
         # Delete by size
-        total_size = sum(os.path.getsize(f) for f in files)
+        total_size = sum(st.st_size for _, st in files)
         while total_size > (self.max_folder_gb * 1024**3) and files:
-            oldest = files.pop(0)
-            total_size -= os.path.getsize(oldest)
+            oldest, st = files.pop(0)
+            total_size -= st.st_size
             os.remove(oldest)
 
     async def handle_command(self, text):
@@ -116,55 +135,68 @@ class NestBot:
                 return "❌ Invalid event number."
 
 
+    async def _sync_device(self, device, now, alert_callback):
+        """Fetches and downloads one camera's new events; blocking library calls run in threads."""
+        d_id = getattr(device, 'device_id', device.device_name)
+        last_ts = self.state.get(d_id)
+        if last_ts:
+            # Calculate minutes since last successful sync
+            delta = int((now - last_ts).total_seconds() / 60) + 2 
+        else:
+            delta = 180 # Default fallback
+
+        logger.info(f"Syncing {device.device_name} (Lookback: {delta}m)")
+        events = await asyncio.to_thread(device.get_events, end_time=now, duration_minutes=delta)
+        
+        latest_event_time = last_ts
+
+        for event in (events or []):
+            # Avoid duplicates
+            if latest_event_time and event.start_time <= latest_event_time:
+                continue
+
+            filename = f"{device.device_name}_{_compact_stamp(event.start_time)}.mp4"
+            filepath = os.path.join(self.download_path, filename)
+
+            # Existence check + streamed download both run in a worker thread
+            saved = await asyncio.to_thread(_download_if_missing, device, event, filepath)
+            if saved:
+                self.recent_events.append((event.start_time, device.device_name, filepath))
+                if len(self.recent_events) > 50: self.recent_events.pop(0)
+                # 2. Filter Alerts by Camera Name and whether messaging is enabled
+                if device.device_name in self.monitored and self.messaging_enabled:
+                    await alert_callback(f"Alert: {device.device_name} - {_alert_stamp(event.start_time)}", filepath)
+
+            if not latest_event_time or event.start_time > latest_event_time:
+                latest_event_time = event.start_time
+
+        # 3. Update State (persisted once per cycle by sync_task, only if something moved)
+        if latest_event_time and latest_event_time != last_ts:
+            self.state[d_id] = latest_event_time
+            self._state_dirty = True
+
+    async def _sync_device_limited(self, device, now, alert_callback):
+        async with self._sync_limit:
+            await self._sync_device(device, now, alert_callback)
+
     async def sync_task(self, alert_callback):
         """Modified sync loop to use the dynamic interval and callback."""
         while True:
             try:
                 now = dt.datetime.now(dt.timezone.utc)
-                for device in self.devices:
-                    d_id = getattr(device, 'device_id', device.device_name)
-                    last_ts_str = self.state.get(d_id)
-                    if last_ts_str:
-                        last_ts = dt.datetime.fromisoformat(last_ts_str)
-                        # Calculate minutes since last successful sync
-                        delta = int((now - last_ts).total_seconds() / 60) + 2 
-                    else:
-                        delta = 180 # Default fallback
-
-                    logger.info(f"Syncing {device.device_name} (Lookback: {delta}m)")
-                    events = device.get_events(end_time=now, duration_minutes=delta)
-                    
-                    latest_event_time = last_ts if last_ts_str else None
-
-                    for event in (events or []):
-                        # Avoid duplicates
-                        if latest_event_time and event.start_time <= latest_event_time:
-                            continue
-
-                        filename = f"{device.device_name}_{event.start_time.strftime('%Y%m%d_%H%M%S')}.mp4"
-                        filepath = os.path.join(self.download_path, filename)
-
-                        if not os.path.exists(filepath):
-                            video_bytes = device.download_camera_event(event)
-                            if video_bytes:
-                                with open(filepath, "wb") as f:
-                                    f.write(video_bytes)
-                                self.recent_events.append((event.start_time, device.device_name, filepath))
-                                if len(self.recent_events) > 50: self.recent_events.pop(0)
-                                # 2. Filter Alerts by Camera Name and whether messaging is enabled
-                                if device.device_name in self.monitored and self.messaging_enabled:
-                                    await alert_callback(f"Alert: {device.device_name} - {event.start_time.strftime('%d-%m-%Y_%H:%M:%S')}", filepath)
-
-                        if not latest_event_time or event.start_time > latest_event_time:
-                            latest_event_time = event.start_time
-
-                    # 3. Update State
-                    if latest_event_time:
-                        self.state[d_id] = latest_event_time.isoformat()
-                        self.save_state()
+                # Cameras are independent: sync them side by side, a few at a time
+                results = await asyncio.gather(
+                    *(self._sync_device_limited(d, now, alert_callback) for d in self.devices),
+                    return_exceptions=True
+                )
+                for device, result in zip(self.devices, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Nest Sync Error ({device.device_name}): {result}")
                 
+                if self._state_dirty:
+                    self.save_state()
                 logger.info(f"Nest Syncing {len(self.devices)} cameras...")
             except Exception as e:
                 logger.error(f"Nest Sync Error: {e}")
             
-            await asyncio.sleep(self.sync_interval * 60)
\ No newline at end of file
+            await asyncio.sleep(self.sync_interval * 60)
@@ -1,23 +1,85 @@
-import json
+import io
+import time
 import asyncio
-import aiohttp
 import os
+import orjson
 import logging
 import xml.etree.ElementTree as ET
-from datetime import datetime
-from dotenv import load_dotenv
+from datetime import datetime, timedelta
+from utils.tools import atomic_write
 
-load_dotenv()
+SAVE_DELAY = 5 # Seconds to coalesce a burst of /add commands into one write
+
+# Monitor poll bounds: back off for far-off departures, tighten as one approaches
+MIN_POLL, MAX_POLL = 15, 300
+
+# Interactive commands reuse a board this long instead of refetching it
+BOARD_TTL = 30
+
+def _local(tag):
+    """'{http://thalesgroup.com/...}std' -> 'std'; the LDB schema versions differ only in namespace."""
+    return tag.rpartition('}')[2]
+
+def _parse_service(service, eta_crs=None):
+    """Single pass over a <service>'s children instead of repeated {*} wildcard searches."""
+    info = {'std': None, 'etd': None, 'dest': "Unknown", 'plat': "TBC", 'eta': "N/A"}
+    for child in service:
+        name = _local(child.tag)
+        if name in ('std', 'etd'):
+            info[name] = child.text
+        elif name == 'platform':
+            info['plat'] = child.text or "TBC"
+        elif name == 'destination':
+            for node in child.iter():
+                if _local(node.tag) == 'locationName':
+                    info['dest'] = node.text
+                    break
+        elif name == 'subsequentCallingPoints' and eta_crs:
+            # Search calling points for the destination CRS
+            for cp in child.iter():
+                if _local(cp.tag) != 'callingPoint': continue
+                fields = {_local(f.tag): f.text for f in cp}
+                if fields.get('crs') == eta_crs:
+                    # If 'et' is 'On time', the time is actually in 'st'
+                    info['eta'] = fields.get('st') if fields.get('et') == "On time" else fields.get('et')
+                    break
+    return info
 
 class TrainBot:
-    def __init__(self):
+    LDB_URL = 'https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb12.asmx'
+    _HEADERS = {'Content-Type': 'text/xml; charset=utf-8'}
+
+    def __init__(self, session):
+        self.session = session
         self.ldb_token = os.getenv("LDB_TOKEN")
         self.default_crs = os.getenv("DEFAULT_CRS", "NEM")
         self.current_context_crs = self.default_crs
         # Subscriptions store (time, station, last_status, last_platform)
         self.subscriptions = {} 
+        # Set while anything is watched; the monitor sleeps on it instead of polling an empty dict
+        self._has_subs = asyncio.Event()
+        # Set by /watch to cut the monitor's sleep short, so a new near departure isn't polled late
+        self._wake = asyncio.Event()
         self.stations_file = "stations.json"
         self.stations = self.load_stations()
+        self._stations_dirty = False
+        self._save_handle = None
+        # Caps concurrent board requests when the monitor polls several stations at once
+        self._fetch_limit = asyncio.Semaphore(5)
+        # (crs, filter_crs, with_details) -> (monotonic fetch time, services)
+        self._board_cache = {}
+        # SOAP envelope encoded once; only {req}, {crs} and {filter} change per request
+        self._payload_tmpl = f"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope" 
+               xmlns:typ="http://thalesgroup.com/RTTI/2013-11-28/Token/types" 
+               xmlns:ldb="http://thalesgroup.com/RTTI/2021-11-01/ldb/">
+    <soap:Header><typ:AccessToken><typ:TokenValue>{self.ldb_token}</typ:TokenValue></typ:AccessToken></soap:Header>
+    <soap:Body>
+        <ldb:{{req}}>
+            <ldb:numRows>10</ldb:numRows><ldb:crs>{{crs}}</ldb:crs>{{filter}}
+        </ldb:{{req}}>
+    </soap:Body>
+</soap:Envelope>""".encode('utf-8')
         
         if not self.ldb_token:
             logging.error("TrainBot: LDB_TOKEN not found.")
@@ -26,79 +88,116 @@ class TrainBot:
         """Loads shortcuts from JSON. survive restarts."""
         if os.path.exists(self.stations_file):
             try:
-                with open(self.stations_file, 'r') as f:
-                    return json.load(f)
+                with open(self.stations_file, 'rb') as f:
+                    return orjson.loads(f.read())
             except: pass
         return {"home": "NEM", "work": "WAT"}
 
     def save_stations(self):
-        with open(self.stations_file, 'w') as f:
-            json.dump(self.stations, f, indent=4)
+        # A direct save supersedes any pending debounced one
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._stations_dirty = False
+        atomic_write(self.stations_file, orjson.dumps(self.stations))
+
+    def schedule_save(self):
+        """Debounced save: the first change arms a timer, later changes ride along with it."""
+        self._stations_dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.save_stations()
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(SAVE_DELAY, self.save_stations)
 
-    async def fetch_trains(self, crs, filter_crs=None, with_details=False):
+    def flush(self):
+        """Writes any pending shortcut changes now (called on shutdown)."""
+        if self._stations_dirty:
+            self.save_stations()
+
+    async def fetch_trains(self, crs, filter_crs=None, with_details=False, use_cache=True):
         """Official Thales Source with Detailed Calling Points support."""
-        url = 'https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb12.asmx'
-        headers = {'Content-Type': 'text/xml; charset=utf-8'}
-        
+        key = (crs, filter_crs, with_details)
+        if use_cache:
+            # A detailed board is a superset of the plain one, so a plain lookup can reuse either
+            for k in (key,) if with_details else (key, (crs, filter_crs, True)):
+                cached = self._board_cache.get(k)
+                if cached and time.monotonic() - cached[0] < BOARD_TTL:
+                    return cached[1]
+
         req_type = "GetDepBoardWithDetailsRequest" if with_details else "GetDepartureBoardRequest"
         filter_tag = f"<ldb:filterCrs>{filter_crs}</ldb:filterCrs><ldb:filterType>to</ldb:filterType>" if filter_crs else ""
         
-        payload = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope" 
-               xmlns:typ="http://thalesgroup.com/RTTI/2013-11-28/Token/types" 
-               xmlns:ldb="http://thalesgroup.com/RTTI/2021-11-01/ldb/">
-    <soap:Header><typ:AccessToken><typ:TokenValue>{self.ldb_token}</typ:TokenValue></typ:AccessToken></soap:Header>
-    <soap:Body>
-        <ldb:{req_type}>
-            <ldb:numRows>10</ldb:numRows><ldb:crs>{crs}</ldb:crs>{filter_tag}
-        </ldb:{req_type}>
-    </soap:Body>
-</soap:Envelope>"""
+        payload = (self._payload_tmpl
+                   .replace(b"{req}", req_type.encode())
+                   .replace(b"{crs}", crs.encode())
+                   .replace(b"{filter}", filter_tag.encode()))
 
-        async with aiohttp.ClientSession() as session:
+        try:
+            async with self.session.post(self.LDB_URL, data=payload, headers=self._HEADERS) as resp:
+                if resp.status != 200: return []
+                body = await resp.read()
+
+            # Stream the raw bytes: each <service> is handled as it closes, then freed
+            eta_crs = filter_crs if with_details else None
+            services = []
+            for _, elem in ET.iterparse(io.BytesIO(body), events=('end',)):
+                if _local(elem.tag) == 'service':
+                    services.append(_parse_service(elem, eta_crs))
+                    elem.clear()
+            if use_cache:
+                now = time.monotonic()
+                # Drop expired boards as new ones arrive so the dict stays small
+                self._board_cache = {k: v for k, v in self._board_cache.items() if now - v[0] < BOARD_TTL}
+                if services:
+                    self._board_cache[key] = (now, services)
+            return services
+        except Exception as e:
+            logging.error(f"Fetch Error: {e}")
+            return []
+
+    async def _fetch_limited(self, crs):
+        async with self._fetch_limit:
+            # Always live: a cached board would delay status/platform alerts
+            return await self.fetch_trains(crs, use_cache=False)
+
+    def _next_poll_delay(self):
+        """Seconds until the next monitor poll: ~10% of the time left to the soonest watched departure."""
+        now = datetime.now()
+        delays = []
+        for time_t in self.subscriptions:
             try:
-                async with session.post(url, data=payload, headers=headers) as resp:
-                    if resp.status != 200: return []
-                    root = ET.fromstring(await resp.text())
-                    services = []
-                    for service in root.findall('.//{*}service'):
-                        std = service.findtext('.//{*}std')
-                        etd = service.findtext('.//{*}etd')
-                        plat = service.findtext('.//{*}platform') or "TBC"
-                        dest_node = service.find('.//{*}destination/{*}location/{*}locationName')
-                        dest_name = dest_node.text if dest_node is not None else "Unknown"
-                        
-                        eta = "N/A"
-                        if with_details and filter_crs:
-                            # Search calling points for the destination CRS
-                            for cp in service.findall('.//{*}callingPoint'):
-                                if cp.findtext('.//{*}crs') == filter_crs:
-                                    # If 'et' is 'On time', the time is actually in 'st'
-                                    est = cp.findtext('.//{*}et')
-                                    sch = cp.findtext('.//{*}st')
-                                    eta = sch if est == "On time" else est
-                                    break
-
-                        services.append({'std': std, 'etd': etd, 'dest': dest_name, 'plat': plat, 'eta': eta})
-                    return services
-            except Exception as e:
-                logging.error(f"Fetch Error: {e}")
-                return []
+                hour, minute = map(int, time_t.split(":"))
+            except ValueError:
+                continue
+            departs = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            # Well in the past means tomorrow; slightly past is a late runner (clamps to MIN_POLL)
+            if departs < now - timedelta(hours=12): departs += timedelta(days=1)
+            delays.append(min(max((departs - now).total_seconds() * 0.1, MIN_POLL), MAX_POLL))
+        return min(delays, default=120)
 
     async def monitor_subscriptions(self, alert_callback):
         """Fixed: Unpacks 4 values (origin, status, plat, dest)."""
         while True:
+            await self._has_subs.wait()
+            self._wake.clear()
             try:
                 to_remove = []
                 # Group by origin station
-                stations = {s for s, _, _, _ in self.subscriptions.values()}
-                for station in stations:
-                    # Monitor doesn't need 'with_details' to keep it fast
-                    trains = await self.fetch_trains(station)
+                stations = list({s for s, _, _, _ in self.subscriptions.values()})
+                # Poll every station concurrently; monitor doesn't need 'with_details' to keep it fast
+                results = await asyncio.gather(*(self._fetch_limited(s) for s in stations), return_exceptions=True)
+                for station, trains in zip(stations, results):
+                    if isinstance(trains, Exception):
+                        logging.error(f"Monitor fetch {station}: {trains}")
+                        continue
+                    # Index once per board; reversed so the first service wins on a shared std
+                    by_std = {t['std']: t for t in reversed(trains)}
                     for time_t, (sub_origin, last_status, last_plat, dest) in list(self.subscriptions.items()):
                         if sub_origin != station: continue
                         
-                        match = next((t for t in trains if t['std'] == time_t), None)
+                        match = by_std.get(time_t)
                         if match:
                             cur_status, cur_plat = match['etd'], match['plat']
                             if cur_status != last_status or cur_plat != last_plat:
@@ -110,7 +209,13 @@ class TrainBot:
                 for t in to_remove: self.subscriptions.pop(t, None)
             except Exception as e:
                 logging.error(f"Monitor: {e}")
-            await asyncio.sleep(120)
+            if not self.subscriptions:
+                self._has_subs.clear()
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._next_poll_delay())
+            except asyncio.TimeoutError:
+                pass
 
     async def handle_command(self, text):
         parts = text.split()
@@ -153,7 +258,7 @@ class TrainBot:
             
             # Fetch details once to get arrival time AND current status/platform
             details = await self.fetch_trains(origin, filter_crs=dest, with_details=True)
-            match = next((t for t in details if t['std'] == time_target), None)
+            match = {t['std']: t for t in reversed(details)}.get(time_target)
             
             # Extract initial data or defaults
             status = match['etd'] if match else "Unknown"
@@ -166,6 +271,8 @@ class TrainBot:
             
             # Save the REAL status and platform immediately
             self.subscriptions[time_target] = (origin, status, plat, dest)
+            self._has_subs.set()
+            self._wake.set()
             return f"🔔 Watching the **{time_target}** from **{origin}**{eta_str}."
 
         if cmd == "/watching":
@@ -181,9 +288,11 @@ class TrainBot:
             if len(parts) > 1:
                 target = parts[1]
                 if self.subscriptions.pop(target, None):
+                    if not self.subscriptions: self._has_subs.clear()
                     return f"✅ Stopped watching **{target}**."
                 return f"❓ No watch for **{target}**."
             self.subscriptions.clear()
+            self._has_subs.clear()
             return "🔕 All watches cleared."
 
         if cmd == "/list":
@@ -192,5 +301,5 @@ class TrainBot:
         if cmd == "/add" and len(parts) >= 3:
             name, crs = parts[1].lower(), parts[2].upper()
             self.stations[name] = crs
-            self.save_stations()
+            self.schedule_save()
             return f"✅ Added shortcut: **{name}** → **{crs}**"
\ No newline at end of file
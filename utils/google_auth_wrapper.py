@@ -1,4 +1,5 @@
 import datetime
+import os
 import requests
 from .nest_api import NestDoorbellDevice 
 
@@ -65,24 +66,50 @@ class GoogleConnection(object):
             password=password,
         )
 
+    def _nest_auth_headers(self):
+        access_token = self._google_auth.get_access_token(service=GoogleConnection.NEST_SCOPE)
+        if not access_token:
+            raise Exception("Couldn't get a Nest access token")
+        return {"Authorization": f"Bearer {access_token}"}
+
     def make_nest_get_request(self, device_id : str, url : str, params={}):
         url = url.format(device_id=device_id)
         logger.debug(f"Sending request to: '{url}' with params: '{params}'")
 
-        access_token = self._google_auth.get_access_token(service=GoogleConnection.NEST_SCOPE)
-        if not access_token:
-            raise Exception("Couldn't get a Nest access token")
-        
         res = requests.get(
             url=url, 
             params=params, 
-            headers={
-                "Authorization": f"Bearer {access_token}"
-            }
+            headers=self._nest_auth_headers()
         )
         res.raise_for_status()
         return res.content
 
+    def download_nest_file(self, device_id : str, url : str, filepath : str, params={}):
+        """Streams the response to filepath in chunks; returns the number of bytes written."""
+        url = url.format(device_id=device_id)
+        logger.debug(f"Downloading: '{url}' with params: '{params}' to '{filepath}'")
+
+        # Write to a .part file so an interrupted download never looks like a finished clip
+        tmp = f"{filepath}.part"
+        written = 0
+        try:
+            with requests.get(url=url, params=params, headers=self._nest_auth_headers(), stream=True) as res:
+                res.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in res.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                        written += len(chunk)
+        except BaseException:
+            # Don't leave a half-written .part behind for cleanup_storage to count
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if written:
+            os.replace(tmp, filepath)
+        else:
+            os.remove(tmp)
+        return written
+
     def get_nest_camera_devices(self):
 
         homegraph_response = self._google_auth.get_homegraph()
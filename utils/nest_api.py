@@ -24,15 +24,17 @@ class NestDoorbellDevice(object):
             CameraEvent.from_attrib(period.attrib, self) for period in periods
         ]
 
-    def __download_event_by_time(self, start_time, end_time):
-        params = {
+    def __event_time_params(self, start_time, end_time):
+        return {
             "start_time" : int(start_time.timestamp()*1000), # 1707368737876
             "end_time" : int(end_time.timestamp()*1000), # 1707368757371
         }
+
+    def __download_event_by_time(self, start_time, end_time):
         return self._connection.make_nest_get_request(
             self._device_id,
             NestDoorbellDevice.DOWNLOAD_VIDEO_URI, 
-            params=params
+            params=self.__event_time_params(start_time, end_time)
         )
     
     @property
@@ -59,6 +61,14 @@ class NestDoorbellDevice(object):
             )
         )
         
+    def download_camera_event_to_file(self, camera_event : CameraEvent, filepath : str):
+        return self._connection.download_nest_file(
+            self._device_id,
+            NestDoorbellDevice.DOWNLOAD_VIDEO_URI,
+            filepath,
+            params=self.__event_time_params(camera_event.start_time, camera_event.end_time)
+        )
+
     def download_camera_event(self, camera_event : CameraEvent):
         return self.__download_event_by_time(
             camera_event.start_time,
@@ -1,4 +1,12 @@
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+
+def atomic_write(path, data):
+    """Writes to a sibling .tmp file and swaps it in, so a crash never leaves a half-written file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(tmp, path)